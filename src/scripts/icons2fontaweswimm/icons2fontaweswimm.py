@@ -1,18 +1,25 @@
 #!/usr/local/bin/fontforge -script
 
 import argparse
-import json
 import logging
-import re
+import os
+import string
 import typing
 from pathlib import Path
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 INITIAL_UTF_GARBAGE_VALUE = 0xE900
 IMPORT_OPTIONS = ('removeoverlap', 'correctdir')
 
 DEFAULT_LANGUAGE = 'English (US)'
 DEFAULT_FAMILY = None
 DEFAULT_STYLE = 'Regular'
+DEFAULT_ENCODING = 'UnicodeFull'
+SHORTCUT_PROPS = frozenset(('lang', 'family', 'style', 'encoding'))
 
 FONT_DIR_NAME = 'fonts'
 DEMO_FILE_NAME = 'demo.html'
@@ -20,14 +27,27 @@ STYLE_FILE_NAME = 'style.css'
 HTML_TEMPLATE_FILE = Path('html_template.html')
 CSS_TEMPLATE_FILE = Path('css_template.css')
 
-REGEX_NUMBER_OF_GLYPHS = r'{{ NUMBER_OF_GLYPHS }}'
-REGEX_GLYPH_LIST = r'{{ GLYPH_LIST }}'
-REGEX_STYLE_LIST = r'{{ STYLE_LIST }}'
+TOKEN_NUMBER_OF_GLYPHS = '{{ NUMBER_OF_GLYPHS }}'
+TOKEN_GLYPH_LIST = '{{ GLYPH_LIST }}'
+TOKEN_STYLE_LIST = '{{ STYLE_LIST }}'
 
 config_type = typing.Dict[str, typing.Union[str, typing.List[str]]]
-glyphs_type = typing.Dict[str, str]
 
-logging.basicConfig(format='%(asctime)s %(levelname)s :: %(message)s', level=logging.DEBUG)
+
+class Glyph(typing.NamedTuple):
+    """
+    A single icon, as it's placed in the font and listed in the demo / style files.
+    """
+
+    codepoint: int
+    utf_code: str
+    path: Path
+    name: str
+
+
+glyphs_type = typing.List[Glyph]
+
+logging.basicConfig(format='%(asctime)s %(levelname)s :: %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 TEMPLATED_HTML = """
@@ -55,27 +75,63 @@ TEMPLATED_HTML = """
 
 TEMPLATED_CSS = """
 .icon-{glyph_name}:before {{
-  content: "\\\\{utf_code}";
+  content: "\\{utf_code}";
 }}
 """
 
 
+def compile_template(template: str) -> typing.Callable[..., str]:
+    """
+    Turn a `str.format` template into a function rendering it, so the format string is parsed only once.
+
+    The generated function takes the template's fields as arguments and simply concatenates them with
+    the template's static text.
+
+    :param template: format string with plain `{field}` replacement fields, e.g. `TEMPLATED_HTML`
+    :type template: str
+    :return: renderer for the template
+    :rtype: typing.Callable[..., str]
+    """
+    pieces = []
+    fields = []
+    for literal, field, format_spec, conversion in string.Formatter().parse(template):
+        if literal:
+            pieces.append(repr(literal))
+        if field is None:
+            continue
+        if not field.isidentifier() or format_spec or conversion:
+            raise ValueError(f'Unsupported replacement field in template: {field!r}')
+        pieces.append(field)
+        if field not in fields:
+            fields.append(field)
+    source = f'def render({", ".join(fields)}):\n    return {" + ".join(pieces) or repr("")}\n'
+    namespace = {}
+    exec(source, namespace)
+    return namespace['render']
+
+
+render_html = compile_template(TEMPLATED_HTML)
+render_css = compile_template(TEMPLATED_CSS)
+
+
 def get_glyphs(icon_dir: Path) -> glyphs_type:
     """
-    Generate a dict mapping a UTF code to it's relevant icon's path.
+    Generate the list of glyphs, assigning each icon its UTF code in file name order.
 
-    :param icon_dir: directory of icons to turn into a font
+    :param icon_dir: directory of icons to turn into a font (sub-directories are ignored)
     :type icon_dir: Path
-    :return: utf code to icon path
-    :rtype: typing.Dict[str, str]
+    :return: glyphs with their codepoint, its hex form (no `0x` prefix), icon path and name (the icon's file stem)
+    :rtype: typing.List[Glyph]
     """
-    glyphs = {}
+    glyphs = []
     utf_counter = INITIAL_UTF_GARBAGE_VALUE
-    for icon in sorted(icon_dir.iterdir()):
-        utf_code = str(hex(utf_counter))
-        icon_path = icon.absolute()
-        glyphs[utf_code] = icon_path
-        logging.debug(f'UTF:{utf_code} - {icon_path}')
+    # `scandir` entries carry their file type, so filtering them doesn't cost a `stat` per icon
+    with os.scandir(icon_dir.absolute()) as entries:
+        icons = sorted((entry for entry in entries if entry.is_file()), key=lambda entry: entry.name)
+    for icon in icons:
+        utf_code = format(utf_counter, 'x')
+        glyphs.append(Glyph(utf_counter, utf_code, Path(icon.path), os.path.splitext(icon.name)[0]))
+        logger.debug('U+%s - %s', utf_code, icon.path)
         utf_counter += 1
     return glyphs
 
@@ -84,12 +140,19 @@ def load_config(base_conf_path: Path) -> config_type:
     """
     Get the base configuration which is the same with every font created.
 
+    List values in `props` are turned into tuples, which is what fontforge expects for sequence attributes.
+
     :param base_conf_path: path to the base config json
     :type base_conf_path: Path
     :return: dictionary consisting of the config object
     :rtype: typing.Dict[str, Union[str, typing.List[str]]]
     """
-    return json.loads(base_conf_path.read_text())
+    config = json_loads(base_conf_path.read_bytes())
+    props = config.get('props', {})
+    for key, value in props.items():
+        if isinstance(value, list):
+            props[key] = tuple(value)
+    return config
 
 
 def initialize_font(config: config_type, glyphs: glyphs_type) -> fontforge.font:
@@ -98,7 +161,7 @@ def initialize_font(config: config_type, glyphs: glyphs_type) -> fontforge.font:
 
     :param config: a loaded config (see `load_config`)
     :type config: config_type
-    :param glyphs: mapping between utf-code to an icon path
+    :param glyphs: glyphs to include, see `get_glyphs`
     :type glyphs: glyphs_type
     :return: initialized font object, ready to be outputted
     :rtype: fontforge.font
@@ -121,19 +184,20 @@ def set_font_properties(font: fontforge.font, config: config_type) -> None:
     :type config: config_type
     """
     props: typing.Dict = config['props']
-    lang: str = props.pop('lang', DEFAULT_LANGUAGE)
-    family: str = props.pop('family', DEFAULT_FAMILY)
-    style: str = props.pop('style', DEFAULT_STYLE)
-    encoding: str = props.pop('encoding', 'UnicodeFull')
+    lang: str = props.get('lang', DEFAULT_LANGUAGE)
+    family: str = props.get('family', DEFAULT_FAMILY)
+    style: str = props.get('style', DEFAULT_STYLE)
+    encoding: str = props.get('encoding', DEFAULT_ENCODING)
     font.encoding = encoding
     if family is not None:
         font.familyname = family
         font.fontname = family + '-' + style
         font.fullname = family + ' ' + style
-    for key, value in config['props'].items():
-        if hasattr(font, key):
-            if isinstance(value, list):
-                value = tuple(value)
+    font_attributes = frozenset(attribute for attribute in dir(font) if not attribute.startswith('_'))
+    for key, value in props.items():
+        if key in SHORTCUT_PROPS:
+            continue
+        if key in font_attributes:
             setattr(font, key, value)
         else:
             font.appendSFNTName(lang, key, value)
@@ -150,12 +214,12 @@ def add_font_glyphs(font: fontforge.font, glyphs: glyphs_type) -> None:
     :param config: loaded config (see `load_config`)
     :type config: config_type
     """
-    for utf_code, icon_path in glyphs.items():
-        logging.debug(f'{utf_code} ;; {icon_path}')
-        char = font.createMappedChar(int(utf_code, base=0))
-        char.importOutlines(str(icon_path), IMPORT_OPTIONS)
+    for glyph in glyphs:
+        logger.debug('%s ;; %s', glyph.utf_code, glyph.path)
+        char = font.createMappedChar(glyph.codepoint)
+        char.importOutlines(str(glyph.path), IMPORT_OPTIONS)
         char.removeOverlap()
-        char.glyphname = Path(icon_path).stem
+        char.glyphname = glyph.name
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -172,71 +236,63 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument(
         '-o', '--output_dir', type=Path, default=Path('output'), help='Path to resource output directory'
     )
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log every glyph as it is processed')
     return parser.parse_args()
 
 
-def generate_demo_html(output_dir: Path, template_dir: Path, glyphs: glyphs_type) -> None:
-    """
-    Create the `demo.html` file in the output directory.
-
-    :param output_dir: where to store the generated file
-    :type output_dir: Path
-    :param template_dir: where the file's template is stored
-    :type template_dir: Path
-    :param glyphs: mapping between utf-code to an icon path
-    :type glyphs: glyphs_type
+def generate_demo_and_css(output_dir: Path, html_template: str, css_template: str, glyphs: glyphs_type) -> None:
     """
-    raw_html = (template_dir / HTML_TEMPLATE_FILE).read_text()
-    raw_html = re.sub(REGEX_NUMBER_OF_GLYPHS, str(len(glyphs)), raw_html)
-    div_list = []
-    for utf_code, icon_path in glyphs.items():
-        utf_code = utf_code[len('0x') :]
-        div_list.append(TEMPLATED_HTML.format(glyph_name=Path(icon_path).stem, utf_code=utf_code))
-    raw_html = re.sub(REGEX_GLYPH_LIST, '\n'.join(div_list), raw_html)
-    demo_path = output_dir / DEMO_FILE_NAME
-    demo_path.write_text(raw_html)
+    Create the `demo.html` and `style.css` files in the output directory.
 
+    Both files are written in a single pass over the glyphs, each glyph being streamed into them as it's rendered.
 
-def generate_style_css(output_dir: Path, template_dir: Path, glyphs: glyphs_type) -> None:
-    """
-    Create the `style.css` file in the output directory.
-
-    :param output_dir: where to store the generated file
+    :param output_dir: where to store the generated files
     :type output_dir: Path
-    :param template_dir: where the file's template is stored
-    :type template_dir: Path
-    :param glyphs: mapping between utf-code to an icon path
+    :param html_template: raw content of the `demo.html` template
+    :type html_template: str
+    :param css_template: raw content of the `style.css` template
+    :type css_template: str
+    :param glyphs: glyphs to include, see `get_glyphs`
     :type glyphs: glyphs_type
     """
-    raw_css = (template_dir / CSS_TEMPLATE_FILE).read_text()
-    classes_list = []
-    for utf_code, icon_path in glyphs.items():
-        utf_code = utf_code[len('0x') :]
-        classes_list.append(TEMPLATED_CSS.format(glyph_name=Path(icon_path).stem, utf_code=utf_code))
-    raw_css = re.sub(REGEX_STYLE_LIST, '\n'.join(classes_list), raw_css)
-    style_path = output_dir / STYLE_FILE_NAME
-    style_path.write_text(raw_css)
+    raw_html = html_template.replace(TOKEN_NUMBER_OF_GLYPHS, str(len(glyphs)))
+    html_head, _, html_tail = raw_html.partition(TOKEN_GLYPH_LIST)
+    css_head, _, css_tail = css_template.partition(TOKEN_STYLE_LIST)
+    with (output_dir / DEMO_FILE_NAME).open('w') as demo_file, (output_dir / STYLE_FILE_NAME).open('w') as style_file:
+        demo_file.write(html_head)
+        style_file.write(css_head)
+        separator = ''
+        for glyph in glyphs:
+            demo_file.writelines((separator, render_html(glyph_name=glyph.name, utf_code=glyph.utf_code)))
+            style_file.writelines((separator, render_css(glyph_name=glyph.name, utf_code=glyph.utf_code)))
+            separator = '\n'
+        demo_file.write(html_tail)
+        style_file.write(css_tail)
 
 
 def main():
     args = parse_arguments()
+    if args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
     logging.info(f'Loading basic config from {args.base_conf}...')
     config = load_config(args.base_conf)
     logging.info(f'Loading glyphs from {args.icon_dir}...')
     glyphs = get_glyphs(args.icon_dir)
+    logging.info(f'Loading templates from {args.template_dir}...')
+    html_template = (args.template_dir / HTML_TEMPLATE_FILE).read_text()
+    css_template = (args.template_dir / CSS_TEMPLATE_FILE).read_text()
     logging.info('Initializing font object...')
     font = initialize_font(config, glyphs)
     logging.info('Generating output fonts...')
     font_dir = args.output_dir / FONT_DIR_NAME
     font_dir.mkdir(parents=True, exist_ok=True)
+    font_dir_str = str(font_dir)
     for outfile in config['output_fonts']:
-        outfile_path = font_dir / outfile
-        logging.debug(f'Generating {outfile_path}')
-        font.generate(str(outfile_path))
-    logging.info('Generating html demo...')
-    generate_demo_html(args.output_dir, args.template_dir, glyphs)
-    logging.info('Generating css styles...')
-    generate_style_css(args.output_dir, args.template_dir, glyphs)
+        outfile_path = os.path.join(font_dir_str, outfile)
+        logger.debug('Generating %s', outfile_path)
+        font.generate(outfile_path)
+    logging.info('Generating html demo and css styles...')
+    generate_demo_and_css(args.output_dir, html_template, css_template, glyphs)
     logging.info('Done!')
 
 